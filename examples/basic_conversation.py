@@ -3,9 +3,9 @@ Basic example of using the Social Stockfish conversation engine.
 """
 
 import asyncio
-import json
 from typing import List, Dict
 import argparse
+import orjson
 from loguru import logger
 
 from social_stockfish import ConversationEngine, SimulationConfig
@@ -36,11 +36,11 @@ async def run_conversation(
 
     async with ConversationEngine(config=config) as engine:
         conversation: List[str] = [initial_message]
-        logger.info(f"Initial message: {initial_message}")
-        logger.info(f"Conversation goal: {goal}")
+        logger.info("Initial message: {}", initial_message)
+        logger.info("Conversation goal: {}", goal)
 
         for turn in range(max_turns):
-            logger.info(f"\nTurn {turn + 1}:")
+            logger.info("\nTurn {}:", turn + 1)
 
             # Get next response
             response = await engine.get_next_response(
@@ -51,14 +51,17 @@ async def run_conversation(
 
             # Add response to conversation
             conversation.append(response.message)
-            logger.info(f"Response: {response.message}")
-            logger.info(f"Confidence: {response.confidence:.2f}")
+            logger.info("Response: {}", response.message)
+            logger.info("Confidence: {:.2f}", response.confidence)
 
             if debug:
                 logger.debug("Alternative responses:")
                 for alt in response.alternatives:
-                    logger.debug(f"- {alt['message']} (score: {alt['score']:.2f})")
-                logger.debug(f"Metadata: {json.dumps(response.metadata, indent=2)}")
+                    logger.debug("- {} (score: {:.2f})", alt["message"], alt["score"])
+                logger.opt(lazy=True).debug(
+                    "Metadata: {}",
+                    lambda: orjson.dumps(response.metadata, option=orjson.OPT_INDENT_2).decode()
+                )
 
             # Analyze conversation state
             if debug:
@@ -68,14 +71,17 @@ async def run_conversation(
                     user_context=user_context,
                     depth=3
                 )
-                logger.debug(f"Analysis: {json.dumps(analysis, indent=2)}")
+                logger.opt(lazy=True).debug(
+                    "Analysis: {}",
+                    lambda: orjson.dumps(analysis, option=orjson.OPT_INDENT_2).decode()
+                )
 
         # Final evaluation
         final_score = await engine.evaluate_conversation(conversation, goal)
-        logger.info(f"\nFinal conversation score: {final_score:.2f}")
+        logger.info("\nFinal conversation score: {:.2f}", final_score)
         logger.info("\nFinal conversation:")
         for i, message in enumerate(conversation):
-            logger.info(f"[{'User' if i % 2 == 0 else 'Assistant'}]: {message}")
+            logger.info("[{}]: {}", "User" if i % 2 == 0 else "Assistant", message)
 
 
 def main():
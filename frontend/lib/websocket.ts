@@ -1,5 +1,6 @@
 import { useEffect } from 'react';
 import { io, Socket } from 'socket.io-client';
+import * as msgpackParser from 'socket.io-msgpack-parser';
 import { create } from 'zustand';
 
 interface WebSocketState {
@@ -13,6 +14,39 @@ interface WebSocketState {
 
 const WEBSOCKET_URL = process.env.NEXT_PUBLIC_WEBSOCKET_URL || 'ws://localhost:8001';
 
+// Dot grid layout; the server only sends per-dot values in index order
+const GRID_COLUMNS = 40;
+const DOT_SPACING = 8;
+const DOT_STATES = ['success', 'warning', 'error', 'neutral'] as const;
+
+function dotPosition(index: number) {
+  return {
+    x: (index % GRID_COLUMNS) * DOT_SPACING + DOT_SPACING,
+    y: Math.floor(index / GRID_COLUMNS) * DOT_SPACING + DOT_SPACING,
+  };
+}
+
+// State updates arrive as a bitmask, one bit per dot (most significant first)
+export function decodeStateUpdate(data: ArrayBuffer): StateUpdate {
+  const bits = new Uint8Array(data);
+  return {
+    dots: Array.from({ length: bits.length * 8 }, (_, i) => ({
+      ...dotPosition(i),
+      active: (bits[i >> 3] & (0x80 >> (i & 7))) !== 0,
+    })),
+  };
+}
+
+// Monte Carlo updates arrive as one DOT_STATES index byte per dot
+export function decodeMonteCarloUpdate(data: ArrayBuffer): MonteCarloUpdate {
+  return {
+    dots: Array.from(new Uint8Array(data), (state, i) => ({
+      ...dotPosition(i),
+      state: DOT_STATES[state],
+    })),
+  };
+}
+
 export const useWebSocket = create<WebSocketState>((set, get) => ({
   socket: null,
   isConnected: false,
@@ -25,6 +59,8 @@ export const useWebSocket = create<WebSocketState>((set, get) => ({
       reconnection: true,
       reconnectionAttempts: 5,
       reconnectionDelay: 1000,
+      // Must match the server's msgpack serializer
+      parser: msgpackParser,
     });
 
     socket.on('connect', () => {
@@ -47,16 +83,25 @@ export const useWebSocket = create<WebSocketState>((set, get) => ({
       // Handle analysis data
     });
 
-    socket.on('state_update', (data) => {
-      console.log('Received state update:', data);
+    socket.on('state_update', (data: ArrayBuffer) => {
+      const update = decodeStateUpdate(data);
+      console.log('Received state update:', update);
       // Handle state update
     });
 
-    socket.on('monte_carlo_update', (data) => {
-      console.log('Received Monte Carlo update:', data);
+    socket.on('monte_carlo_update', (data: ArrayBuffer) => {
+      const update = decodeMonteCarloUpdate(data);
+      console.log('Received Monte Carlo update:', update);
       // Handle Monte Carlo update
     });
 
+    // Several events sent in one frame; dispatch each to its listeners
+    socket.on('batch', (items: BatchItem[]) => {
+      items.forEach(({ event, data }) => {
+        socket.listeners(event).forEach((listener) => listener(data));
+      });
+    });
+
     socket.on('error', (error) => {
       console.error('WebSocket error:', error);
     });
@@ -80,6 +125,12 @@ export const useWebSocket = create<WebSocketState>((set, get) => ({
   },
 }));
 
+// Binary events, decoded before they reach useWebSocketEvent callbacks
+const EVENT_DECODERS: Record<string, (data: ArrayBuffer) => unknown> = {
+  state_update: decodeStateUpdate,
+  monte_carlo_update: decodeMonteCarloUpdate,
+};
+
 // Custom hook for WebSocket events
 export function useWebSocketEvent<T>(
   eventName: string,
@@ -90,15 +141,25 @@ export function useWebSocketEvent<T>(
   useEffect(() => { 
     if (!socket) return;
 
-    socket.on(eventName, callback);
+    const decode = EVENT_DECODERS[eventName];
+    const listener = decode
+      ? (data: ArrayBuffer) => callback(decode(data) as T)
+      : callback;
+
+    socket.on(eventName, listener);
 
     return () => {
-      socket.off(eventName, callback);
+      socket.off(eventName, listener);
     };
   }, [socket, eventName, callback]);
 }
 
 // WebSocket event types
+export interface BatchItem {
+  event: string;
+  data: any;
+}
+
 export interface Message {
   id: string;
   text: string;
@@ -7,6 +7,11 @@ import uvicorn
 from dotenv import load_dotenv
 from loguru import logger
 
+try:
+    import uvloop
+except ImportError:  # uvloop doesn't support Windows
+    uvloop = None
+
 # Load environment variables
 load_dotenv()
 
@@ -29,28 +34,33 @@ def main():
         reload = os.getenv("RELOAD", "false").lower() == "true"
         workers = int(os.getenv("WORKERS", "1"))
         log_level = os.getenv("LOG_LEVEL", "info")
+        loop = "uvloop" if uvloop is not None else "asyncio"
 
         # Log startup configuration
         logger.info(f"Starting server on {host}:{port}")
         logger.info(f"Workers: {workers}")
         logger.info(f"Auto-reload: {reload}")
         logger.info(f"Log level: {log_level}")
+        logger.info(f"Event loop: {loop}")
 
         # Create logs directory if it doesn't exist
         os.makedirs("logs", exist_ok=True)
 
         # Start server
         uvicorn.run(
-            "websocket_server:app",
+            "websocket_server:socket_app",
             host=host,
             port=port,
             reload=reload,
             workers=workers,
             log_level=log_level,
+            ws="websockets",
+            ws_max_size=1024 * 1024,
+            ws_per_message_deflate=True,
             ws_ping_interval=20,
             ws_ping_timeout=20,
             timeout_keep_alive=30,
-            loop="auto"
+            loop=loop
         )
 
     except Exception as e:
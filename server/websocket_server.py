@@ -3,9 +3,12 @@ WebSocket server for Social Stockfish using socket.io.
 """
 
 import asyncio
-import json
 import logging
-from typing import Dict, Set, Any, Optional
+import time
+from collections import deque
+from itertools import islice
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Set, Any, Optional, Tuple
 from fastapi import FastAPI
 from pydantic import BaseModel
 import numpy as np
@@ -18,42 +21,72 @@ logger = logging.getLogger(__name__)
 # Create FastAPI app
 app = FastAPI()
 
-# Create Socket.IO server
+# Create Socket.IO server. Packets are msgpack-encoded, which keeps the
+# numeric and binary payloads compact; clients use the matching parser.
 sio = socketio.AsyncServer(
     async_mode='asgi',
-    cors_allowed_origins=['http://localhost:3000']
+    cors_allowed_origins=['http://localhost:3000'],
+    serializer='msgpack',
+    # Only compress long-polling responses large enough to benefit
+    compression_threshold=1024
 )
 
 # Wrap with ASGI app
 socket_app = socketio.ASGIApp(sio, app)
 
+# Visualization grid layout (40 columns x 15 rows). Clients derive each
+# dot's position from its index, so only per-dot values are sent.
+GRID_SIZE = 600
+DOT_STATES = ("success", "warning", "error", "neutral")
+DOT_STATE_PROBS = (0.3, 0.3, 0.2, 0.2)
+
+# Number of precomputed grid update frames shared across clients
+UPDATE_RING_SIZE = 8
+
+# Upper bound on the number of events merged into one batch frame
+MAX_BATCH_ITEMS = 8
+
+# Per-client state is bounded so long sessions don't grow without limit
+MAX_HISTORY = 256
+MAX_ANALYSIS_RESULTS = 64
+RESPONSE_CONTEXT_TURNS = 32
+CLIENT_IDLE_TIMEOUT = 300  # Seconds without a message before state is released
+
 # Store client data
 client_data: Dict[str, Dict[str, Any]] = {}
 
+# Set while at least one client is connected
+_has_clients = asyncio.Event()
+
 @sio.event
 async def connect(sid, environ):
     """Handle client connection."""
-    logger.info(f"Client connected: {sid}")
+    logger.info("Client connected: %s", sid)
     client_data[sid] = {
-        "conversation_history": [],
+        "conversation_history": deque(maxlen=MAX_HISTORY),
         "goal": None,
-        "analysis_results": []
+        "analysis_results": deque(maxlen=MAX_ANALYSIS_RESULTS),
+        "last_activity": time.monotonic()
     }
+    _has_clients.set()
 
 @sio.event
 async def disconnect(sid):
     """Handle client disconnection."""
-    logger.info(f"Client disconnected: {sid}")
+    logger.info("Client disconnected: %s", sid)
     client_data.pop(sid, None)
+    if not client_data:
+        _has_clients.clear()
 
 @sio.on('message')
 async def handle_message(sid, data):
     """Handle incoming messages."""
     try:
-        logger.info(f"Received message from {sid}: {data}")
+        logger.debug("Received message from %s: %s", sid, data)
         
         # Update conversation history
         user_data = client_data[sid]
+        user_data["last_activity"] = time.monotonic()
         user_data["conversation_history"].append({
             "text": data["text"],
             "sender": "user",
@@ -61,21 +94,24 @@ async def handle_message(sid, data):
         })
 
         # Generate response using Social Stockfish
-        response = await generate_response(user_data)
+        response = await generate_response(
+            recent_history(user_data),
+            user_data["goal"]
+        )
         user_data["conversation_history"].append(response)
 
-        # Send response
-        await sio.emit('message', response, room=sid)
+        # Send the response and state updates in a single frame
+        async with cork(sid) as batch:
+            await batch.emit('message', response)
+            for event, payload in next_state_updates():
+                await batch.emit(event, payload)
 
-        # Generate and send analysis
+        # The analysis can take a while; don't hold the response back for it
         analysis = await generate_analysis(user_data)
         await sio.emit('analysis', analysis, room=sid)
 
-        # Generate and send state updates
-        await send_state_updates(sid)
-
     except Exception as e:
-        logger.error(f"Error handling message: {e}")
+        logger.error("Error handling message: %s", e)
         await sio.emit('error', {"message": str(e)}, room=sid)
 
 @sio.on('update_goal')
@@ -83,12 +119,22 @@ async def handle_goal_update(sid, data):
     """Handle goal updates."""
     try:
         client_data[sid]["goal"] = data["goal"]
-        logger.info(f"Updated goal for {sid}: {data['goal']}")
+        client_data[sid]["last_activity"] = time.monotonic()
+        logger.info("Updated goal for %s: %s", sid, data["goal"])
     except Exception as e:
-        logger.error(f"Error updating goal: {e}")
+        logger.error("Error updating goal: %s", e)
         await sio.emit('error', {"message": str(e)}, room=sid)
 
-async def generate_response(user_data: Dict[str, Any]) -> Dict[str, Any]:
+def recent_history(user_data: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Get the most recent turns used as context for a response."""
+    history = user_data["conversation_history"]
+    start = max(0, len(history) - RESPONSE_CONTEXT_TURNS)
+    return list(islice(history, start, None))
+
+async def generate_response(
+    history: List[Dict[str, Any]],
+    goal: Optional[str]
+) -> Dict[str, Any]:
     """Generate a response using Social Stockfish."""
     # TODO: Implement actual response generation
     return {
@@ -106,46 +152,103 @@ async def generate_analysis(user_data: Dict[str, Any]) -> Dict[str, Any]:
         "alternatives": []
     }
 
-async def send_state_updates(sid: str):
-    """Send state exploration and Monte Carlo updates."""
-    # Generate state exploration data
-    state_data = {
-        "dots": [
-            {
-                "x": i % 40 * 8 + 8,
-                "y": i // 40 * 8 + 8,
-                "active": np.random.random() > 0.7
-            }
-            for i in range(600)
-        ]
-    }
-    await sio.emit('state_update', state_data, room=sid)
-
-    # Generate Monte Carlo data
-    monte_carlo_data = {
-        "dots": [
-            {
-                "x": i % 40 * 8 + 8,
-                "y": i // 40 * 8 + 8,
-                "state": np.random.choice(
-                    ["success", "warning", "error", "neutral"],
-                    p=[0.3, 0.3, 0.2, 0.2]
-                )
-            }
-            for i in range(600)
-        ]
-    }
-    await sio.emit('monte_carlo_update', monte_carlo_data, room=sid)
+def generate_state_updates() -> List[Tuple[str, bytes]]:
+    """Generate state exploration and Monte Carlo update events."""
+    # State exploration data as a bitmask, one bit per dot (75 bytes)
+    active = np.random.random(GRID_SIZE) > 0.7
+
+    # Monte Carlo data as one DOT_STATES index byte per dot
+    states = np.random.choice(len(DOT_STATES), size=GRID_SIZE, p=DOT_STATE_PROBS)
+
+    return [
+        ('state_update', np.packbits(active).tobytes()),
+        ('monte_carlo_update', states.astype(np.uint8).tobytes())
+    ]
+
+# Precomputed update frames shared by all clients. Each tick regenerates
+# the next slot; per-message emits cycle through the ring instead of
+# generating new frames.
+_update_ring = [generate_state_updates() for _ in range(UPDATE_RING_SIZE)]
+_ring_index = 0
+
+def next_state_updates() -> List[Tuple[str, bytes]]:
+    """Advance the ring and return its update frame."""
+    global _ring_index
+    _ring_index = (_ring_index + 1) % UPDATE_RING_SIZE
+    return _update_ring[_ring_index]
+
+def refresh_state_updates() -> List[Tuple[str, bytes]]:
+    """Advance the ring, replacing its next slot with a fresh frame."""
+    global _ring_index
+    _ring_index = (_ring_index + 1) % UPDATE_RING_SIZE
+    _update_ring[_ring_index] = generate_state_updates()
+    return _update_ring[_ring_index]
+
+async def send_state_updates(sid: Optional[str] = None):
+    """
+    Send state exploration and Monte Carlo updates.
+
+    Broadcasts a freshly generated frame to every connected client when no
+    sid is given.
+    """
+    updates = next_state_updates() if sid else refresh_state_updates()
+    for event, payload in updates:
+        await sio.emit(event, payload, room=sid)
+
+class EmitBatch:
+    """Collects events for one client and sends them as one batch event."""
+
+    def __init__(self, sid: str):
+        self.sid = sid
+        self.items: List[Dict[str, Any]] = []
+
+    async def emit(self, event: str, data: Any):
+        """Queue an event, flushing once the batch is full."""
+        self.items.append({"event": event, "data": data})
+        if len(self.items) >= MAX_BATCH_ITEMS:
+            await self.flush()
+
+    async def flush(self):
+        """Send all queued events as a single 'batch' event."""
+        if self.items:
+            items, self.items = self.items, []
+            await sio.emit('batch', items, room=self.sid)
+
+@asynccontextmanager
+async def cork(sid: str) -> AsyncIterator[EmitBatch]:
+    """Batch all events emitted to a client within the block."""
+    batch = EmitBatch(sid)
+    try:
+        yield batch
+    finally:
+        await batch.flush()
+
+def release_idle_clients():
+    """
+    Drop the conversation state of clients that haven't sent anything for
+    a while.
+
+    The connection is left open, since clients don't reconnect after a
+    server-side disconnect and passive viewers still need state updates.
+    The next message from a released client starts a fresh conversation.
+    """
+    cutoff = time.monotonic() - CLIENT_IDLE_TIMEOUT
+    for sid, user_data in client_data.items():
+        if user_data["last_activity"] < cutoff and user_data["conversation_history"]:
+            logger.info("Releasing conversation state of idle client: %s", sid)
+            user_data["conversation_history"].clear()
+            user_data["analysis_results"].clear()
 
 async def background_updates():
     """Send periodic background updates to all clients."""
     while True:
-        for sid in client_data:
-            try:
-                await send_state_updates(sid)
-            except Exception as e:
-                logger.error(f"Error sending background updates: {e}")
-                client_data.pop(sid, None)
+        # Sleep until someone is connected
+        await _has_clients.wait()
+        release_idle_clients()
+        try:
+            await send_state_updates()
+        except Exception as e:
+            logger.error("Error sending background updates: %s", e)
         await asyncio.sleep(3)  # Update every 3 seconds
 
 @app.on_event("startup")
@@ -35,6 +35,7 @@ setup(
         "networkx>=3.2.1",
         "numpy>=1.26.4",
         "openai>=1.12.0",
+        "orjson>=3.9.15",
         "pydantic>=2.6.3",
         "python-dotenv>=1.0.1",
         "tenacity>=8.2.3",
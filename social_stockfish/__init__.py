@@ -7,7 +7,8 @@ from social_stockfish.models import (
     ConversationNode,
     ConversationPath,
     SimulationConfig,
-    ConversationResponse
+    ConversationResponse,
+    UserContext
 )
 
 __version__ = "0.1.0"
@@ -18,5 +19,6 @@ __all__ = [
     "ConversationNode",
     "ConversationPath",
     "SimulationConfig",
-    "ConversationResponse"
+    "ConversationResponse",
+    "UserContext"
 ] 
\ No newline at end of file
@@ -4,14 +4,87 @@ OpenRouter API client for Social Stockfish.
 
 import os
 import asyncio
-from typing import List, Dict, Any, Optional
+import hashlib
+import re
+from collections import OrderedDict
+from functools import lru_cache
+from typing import List, Dict, Any, Callable, Optional, Sequence, Tuple
 import aiohttp
+import orjson
 from loguru import logger
 from tenacity import retry, stop_after_attempt, wait_exponential
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# First whole number in the evaluator's reply, e.g. "Score: 0.85." or "8/10"
+_SCORE_RE = re.compile(r"(?<![\d.])(\d+(?:\.\d+)?|\.\d+)(?!\d)(\s*/\s*10(?!\d))?")
+
+# Chat roles of even and odd history turns, from each proxy's perspective
+_USER_ROLES = ("user", "assistant")
+_OPPONENT_ROLES = ("assistant", "user")
+
+
+@lru_cache(maxsize=256)
+def _system_message(
+    style: str,
+    personality: str,
+    goals: Tuple[str, ...],
+    is_user: bool
+) -> Dict[str, str]:
+    """
+    Build the system message for a proxy's context.
+
+    Shared by every history formatted with the same context; must not be
+    mutated.
+    """
+    role = "user" if is_user else "opponent"
+
+    return {
+        "role": "system",
+        "content": (
+            f"You are acting as the {role} in this conversation. "
+            f"Your communication style is {style}. "
+            f"Your personality is {personality}. "
+            f"Your goals are: {', '.join(goals)}\n\n"
+            "Generate a natural, contextually appropriate next response "
+            "that aligns with your character and goals."
+        )
+    }
+
+
+@lru_cache(maxsize=4096)
+def _format_messages(
+    history: Tuple[str, ...],
+    style: str,
+    personality: str,
+    goals: Tuple[str, ...],
+    is_user: bool
+) -> Tuple[Dict[str, str], ...]:
+    """
+    Build the chat messages for a conversation prefix.
+
+    Memoized on the full prefix, so nodes sharing a history reuse the same
+    messages. The returned dicts are shared and must not be mutated.
+    """
+    messages = [_system_message(style, personality, goals, is_user)]
+
+    # Add conversation history, alternating roles from the first turn
+    roles = _USER_ROLES if is_user else _OPPONENT_ROLES
+    messages.extend(
+        {"role": roles[i & 1], "content": message}
+        for i, message in enumerate(history)
+    )
+
+    return tuple(messages)
+
+
+def _retrieve_exception(task: asyncio.Task) -> None:
+    """Mark a shared request's failure as handled; its waiters re-raise it."""
+    if not task.cancelled():
+        task.exception()
+
+
 class OpenRouterClient:
     """
     Async client for OpenRouter API interactions.
@@ -21,7 +94,9 @@ class OpenRouterClient:
         self,
         api_key: Optional[str] = None,
         base_url: str = "https://openrouter.ai/api/v1",
-        default_models: Optional[Dict[str, str]] = None
+        default_models: Optional[Dict[str, str]] = None,
+        cache_size: int = 1000,
+        evaluation_window: int = 5
     ):
         """Initialize the OpenRouter client."""
         self.api_key = api_key or os.getenv("OPENROUTER_API_KEY")
@@ -29,6 +104,7 @@ class OpenRouterClient:
             raise ValueError("OpenRouter API key is required")
 
         self.base_url = base_url
+        self._completions_url = f"{base_url}/chat/completions"
         self.default_models = default_models or {
             "user_proxy": "anthropic/claude-3-opus-20240229",
             "opponent_proxy": "anthropic/claude-3-opus-20240229",
@@ -38,6 +114,16 @@ class OpenRouterClient:
         self._session: Optional[aiohttp.ClientSession] = None
         self._credential_semaphore = asyncio.Semaphore(50)  # Rate limit protection
 
+        # LRU cache of completed responses plus the tasks of requests in
+        # flight, so concurrent identical requests share a single round-trip
+        self.cache_size = cache_size
+        self._response_cache: OrderedDict[bytes, Dict[str, Any]] = OrderedDict()
+        self._inflight: Dict[bytes, asyncio.Task] = {}
+
+        # Evaluation scores keyed on the last evaluation_window turns
+        self.evaluation_window = evaluation_window
+        self._score_cache: OrderedDict[bytes, float] = OrderedDict()
+
     async def __aenter__(self):
         """Async context manager entry."""
         await self.init_session()
@@ -50,7 +136,20 @@ class OpenRouterClient:
     async def init_session(self):
         """Initialize the aiohttp session."""
         if self._session is None:
+            # Keep connections to the API alive between the many small
+            # completion requests issued during a search. Only the API host
+            # is contacted, so the per-host cap is the one that matters;
+            # in-flight requests are bounded by the credential semaphore.
+            connector = aiohttp.TCPConnector(
+                limit=0,
+                limit_per_host=256,
+                ttl_dns_cache=300,
+                keepalive_timeout=60,
+                enable_cleanup_closed=True
+            )
             self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=60),
                 headers={
                     "Authorization": f"Bearer {self.api_key}",
                     "Content-Type": "application/json"
@@ -67,37 +166,37 @@ class OpenRouterClient:
         stop=stop_after_attempt(3),
         wait=wait_exponential(multiplier=1, min=4, max=10)
     )
-    async def _make_request(
-        self,
-        endpoint: str,
-        method: str = "POST",
-        **kwargs
-    ) -> Dict[str, Any]:
-        """Make an API request with retry logic."""
+    async def _make_request(self, body: bytes) -> Dict[str, Any]:
+        """Post a serialized chat completion request with retry logic."""
         if self._session is None:
             await self.init_session()
 
-        async with self._credential_semaphore:
-            async with self._session.request(
-                method,
-                f"{self.base_url}/{endpoint}",
-                **kwargs
-            ) as response:
-                response.raise_for_status()
-                return await response.json()
+        async with (
+            self._credential_semaphore,
+            self._session.post(self._completions_url, data=body) as response
+        ):
+            response.raise_for_status()
+            return orjson.loads(await response.read())
 
     async def generate_responses(
         self,
-        messages: List[Dict[str, str]],
+        messages: Sequence[Dict[str, str]],
         model: str,
         temperature: float = 0.7,
         top_p: float = 0.9,
         max_tokens: int = 150,
         stop: Optional[List[str]] = None,
+        n: int = 1,
+        cache_if: Optional[Callable[[Dict[str, Any]], bool]] = None,
         **kwargs
     ) -> Dict[str, Any]:
         """
         Generate responses using the specified model.
+
+        Setting ``n`` requests that many completions in a single call; they
+        are returned as separate entries in ``choices``. Fresh responses for
+        which ``cache_if`` returns False are returned but not cached, so a
+        malformed reply is requested again next time.
         """
         payload = {
             "model": model,
@@ -106,22 +205,67 @@ class OpenRouterClient:
             "top_p": top_p,
             "max_tokens": max_tokens,
             "stop": stop,
+            "n": n,
             **kwargs
         }
 
+        # Serialize once with sorted keys so the body doubles as cache key
+        body = orjson.dumps(payload, option=orjson.OPT_SORT_KEYS)
+        key = hashlib.blake2b(body, digest_size=16).digest()
+
+        cached = self._cache_get(self._response_cache, key)
+        if cached is not None:
+            return cached
+
+        inflight = self._inflight.get(key)
+        if inflight is None:
+            # The request runs in its own task so that no single caller
+            # owns it; a cancelled caller leaves it running for the others
+            inflight = asyncio.ensure_future(self._fetch_response(key, body, cache_if))
+            inflight.add_done_callback(_retrieve_exception)
+            self._inflight[key] = inflight
+
+        return await asyncio.shield(inflight)
+
+    async def _fetch_response(
+        self,
+        key: bytes,
+        body: bytes,
+        cache_if: Optional[Callable[[Dict[str, Any]], bool]] = None
+    ) -> Dict[str, Any]:
+        """Issue an in-flight request and cache its response."""
         try:
-            response = await self._make_request(
-                "chat/completions",
-                json=payload
-            )
-            return response
+            response = await self._make_request(body)
         except Exception as e:
             logger.error(f"Error generating responses: {e}")
             raise
+        else:
+            # Populate the cache before leaving the in-flight table
+            if cache_if is None or cache_if(response):
+                self._cache_put(self._response_cache, key, response)
+            return response
+        finally:
+            self._inflight.pop(key, None)
+
+    def _cache_get(self, cache: OrderedDict, key: bytes) -> Optional[Any]:
+        """Look up a cached value, marking it as recently used."""
+        value = cache.get(key)
+        if value is not None:
+            cache.move_to_end(key)
+        return value
+
+    def _cache_put(self, cache: OrderedDict, key: bytes, value: Any) -> None:
+        """Store a value, evicting the least recently used entry."""
+        if self.cache_size <= 0:
+            return
+        cache[key] = value
+        cache.move_to_end(key)
+        if len(cache) > self.cache_size:
+            cache.popitem(last=False)
 
     async def generate_user_response(
         self,
-        conversation_history: List[str],
+        conversation_history: Sequence[str],
         user_context: Dict[str, Any],
         **kwargs
     ) -> Dict[str, Any]:
@@ -141,7 +285,7 @@ class OpenRouterClient:
 
     async def generate_opponent_response(
         self,
-        conversation_history: List[str],
+        conversation_history: Sequence[str],
         opponent_context: Dict[str, Any],
         **kwargs
     ) -> Dict[str, Any]:
@@ -159,6 +303,93 @@ class OpenRouterClient:
             **kwargs
         )
 
+    async def generate_and_score(
+        self,
+        conversation_history: Sequence[str],
+        context: Dict[str, Any],
+        k: int,
+        is_user: bool,
+        goal: str,
+        **kwargs
+    ) -> Dict[str, Any]:
+        """
+        Generate k candidate next turns and score the conversation so far.
+
+        A single prompt asks the proxy for a JSON object of the form
+        ``{"candidates": [{"message", "probability"}], "self_score"}``.
+        Returns that structure with probabilities and the score clamped to
+        [0, 1]; ``self_score`` is None and ``candidates`` empty when the
+        reply can't be parsed.
+        """
+        messages = (
+            *self._format_conversation(conversation_history, context, is_user),
+            {
+                "role": "system",
+                "content": (
+                    f"Propose {k} distinct candidate next responses, each with "
+                    "the probability that you would say it. Also score from 0 "
+                    "to 1 how well the conversation so far achieves this goal: "
+                    f"{goal}\n\n"
+                    "Respond with ONLY a JSON object of the form "
+                    '{"candidates": [{"message": "...", "probability": 0.5}], '
+                    '"self_score": 0.5}'
+                )
+            }
+        )
+        kwargs.setdefault("max_tokens", 150 * k + 20)
+
+        # Only replies that yield candidates are cached; the parse done for
+        # that check is kept when this call issued the request
+        parsed: List[Dict[str, Any]] = []
+
+        def has_candidates(response: Dict[str, Any]) -> bool:
+            parsed.append(self._parse_generate_and_score(response, k))
+            return bool(parsed[-1]["candidates"])
+
+        response = await self.generate_responses(
+            messages,
+            model=self.default_models["user_proxy" if is_user else "opponent_proxy"],
+            cache_if=has_candidates,
+            **kwargs
+        )
+        return parsed[0] if parsed else self._parse_generate_and_score(response, k)
+
+    def _parse_generate_and_score(
+        self,
+        response: Dict[str, Any],
+        k: int
+    ) -> Dict[str, Any]:
+        """Parse the JSON reply of a generate_and_score request."""
+        result: Dict[str, Any] = {"candidates": [], "self_score": None}
+        try:
+            content = response["choices"][0]["message"]["content"]
+            # Models sometimes wrap the object in prose or a code fence
+            payload = orjson.loads(content[content.index("{"):content.rindex("}") + 1])
+            candidates = payload["candidates"]
+        except (KeyError, IndexError, TypeError, ValueError) as e:
+            logger.error(f"Error parsing generated candidates: {e}")
+            return result
+
+        for candidate in candidates[:k]:
+            try:
+                message = candidate["message"]
+                probability = float(candidate.get("probability", 0.5))
+            except (KeyError, TypeError, ValueError, AttributeError) as e:
+                logger.error(f"Error parsing candidate: {e}")
+                continue
+            if isinstance(message, str) and message:
+                result["candidates"].append({
+                    "message": message,
+                    "probability": max(0.0, min(1.0, probability))
+                })
+
+        try:
+            result["self_score"] = max(0.0, min(1.0, float(payload["self_score"])))
+        except (KeyError, TypeError, ValueError) as e:
+            logger.error(f"Error parsing self score: {e}")
+
+        return result
+
     async def evaluate_conversation(
         self,
         conversation: List[str],
@@ -167,7 +398,36 @@ class OpenRouterClient:
     ) -> float:
         """
         Evaluate a conversation path and return a score.
+
+        Scores are cached on the goal and the last ``evaluation_window``
+        turns, since the tail of the conversation drives the evaluation.
+        Single-turn conversations are not cached.
         """
+        key = None
+        if len(conversation) >= 2:
+            key = self._score_key(conversation, goal)
+            score = self._cache_get(self._score_cache, key)
+            if score is not None:
+                return score
+
+        score = await self._score_conversation(conversation, goal, **kwargs)
+        if key is not None:
+            self._cache_put(self._score_cache, key, score)
+        return score
+
+    def _score_key(self, conversation: List[str], goal: str) -> bytes:
+        """Hash the tail of a conversation and its goal into a score key."""
+        tail = conversation[-self.evaluation_window:]
+        encoded = b"\n".join(turn.encode() for turn in tail) + b"|" + goal.encode()
+        return hashlib.blake2b(encoded, digest_size=16).digest()
+
+    async def _score_conversation(
+        self,
+        conversation: List[str],
+        goal: str,
+        **kwargs
+    ) -> float:
+        """Ask the evaluator model to score a conversation."""
         messages = [
             {
                 "role": "system",
@@ -195,42 +455,33 @@ class OpenRouterClient:
         )
 
         try:
-            score = float(response["choices"][0]["message"]["content"].strip())
-            return max(0.0, min(1.0, score))  # Clamp between 0 and 1
-        except (ValueError, KeyError, IndexError) as e:
+            content = response["choices"][0]["message"]["content"]
+        except (KeyError, IndexError, TypeError) as e:
             logger.error(f"Error parsing evaluation score: {e}")
             return 0.0
 
+        match = _SCORE_RE.search(content)
+        if match is None:
+            logger.error(f"Error parsing evaluation score: {content!r}")
+            return 0.0
+        score = float(match.group(1))
+        if match.group(2):
+            score /= 10  # Out-of-ten answers
+        return max(0.0, min(1.0, score))  # Clamp between 0 and 1
+
     def _format_conversation(
         self,
-        history: List[str],
+        history: Sequence[str],
         context: Dict[str, Any],
         is_user: bool
-    ) -> List[Dict[str, str]]:
+    ) -> Tuple[Dict[str, str], ...]:
         """
         Format conversation history and context for the API.
         """
-        role = "user" if is_user else "opponent"
-        style = context.get("style", "professional")
-        personality = context.get("personality", "neutral")
-        goals = context.get("goals", [])
-
-        system_message = (
-            f"You are acting as the {role} in this conversation. "
-            f"Your communication style is {style}. "
-            f"Your personality is {personality}. "
-            f"Your goals are: {', '.join(goals)}\n\n"
-            "Generate a natural, contextually appropriate next response "
-            "that aligns with your character and goals."
+        return _format_messages(
+            tuple(history),
+            context.get("style", "professional"),
+            context.get("personality", "neutral"),
+            tuple(context.get("goals", [])),
+            is_user
         )
-
-        messages = [{"role": "system", "content": system_message}]
-
-        # Add conversation history
-        for i, message in enumerate(history):
-            messages.append({
-                "role": "user" if i % 2 == (0 if is_user else 1) else "assistant",
-                "content": message
-            })
-
-        return messages 
\ No newline at end of file
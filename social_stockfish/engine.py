@@ -2,7 +2,7 @@
 Main conversation engine for Social Stockfish.
 """
 
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 from loguru import logger
 
 from social_stockfish.models import (
@@ -28,14 +28,23 @@ class ConversationEngine:
         exploration_constant: float = 1.41
     ):
         """Initialize the conversation engine."""
-        self.api_client = OpenRouterClient(api_key=api_key)
         self.config = config or SimulationConfig()
+        self.api_client = OpenRouterClient(
+            api_key=api_key,
+            cache_size=self.config.cache_size,
+            evaluation_window=self.config.max_depth
+        )
         self.mcts = MCTS(
             api_client=self.api_client,
             config=self.config,
             exploration_constant=exploration_constant
         )
 
+        # Tree from the previous get_next_response call and the contexts it
+        # was searched with, reused when the conversation continues it
+        self._last_root: Optional[ConversationNode] = None
+        self._last_contexts: Optional[Tuple[UserContext, Dict[str, Any]]] = None
+
     async def __aenter__(self):
         """Async context manager entry."""
         await self.api_client.init_session()
@@ -57,14 +66,6 @@ class ConversationEngine:
         Get the best next response for the current conversation state.
         """
         try:
-            # Create root node from current state
-            root = ConversationNode(
-                message=conversation_history[-1] if conversation_history else "",
-                probability=1.0,
-                turn_type="opponent" if conversation_history else "user",
-                metadata={"visits": 1}
-            )
-
             # Create user context
             user_ctx = UserContext(
                 style=user_context.get("style", "professional"),
@@ -80,26 +81,47 @@ class ConversationEngine:
                 "goals": ["engage in meaningful conversation"]
             }
 
+            # Continue from the previous tree if the conversation followed
+            # it; its visits count towards this turn's budget
+            root = self._reuse_root(conversation_history, (user_ctx, opp_context))
+            if root is None:
+                root = ConversationNode(
+                    message=conversation_history[-1] if conversation_history else "",
+                    probability=1.0,
+                    turn_type="opponent" if conversation_history else "user",
+                    visits=1
+                )
+                inherited_visits = 0
+            else:
+                inherited_visits = root.visits
+
             # Perform MCTS search
-            best_node = await self.mcts.search(
+            await self.mcts.search(
                 root=root,
                 user_context=user_ctx,
                 opponent_context=opp_context,
-                num_simulations=num_simulations
+                num_simulations=max(num_simulations - inherited_visits, 0)
             )
+            self._last_root = root
+            self._last_contexts = (user_ctx, opp_context)
 
             # Get best path and alternatives
-            best_path = self.mcts.get_best_path(best_node)
-            alternatives = self._get_alternative_responses(best_node)
+            best_path, alternatives, stats = self.mcts.summarize(root)
+            best_node = best_path.nodes[0]
 
             return ConversationResponse(
                 message=best_node.message,
                 confidence=best_node.score or 0.0,
-                alternatives=alternatives,
+                alternatives=[
+                    {"message": n.message, "score": n.score}
+                    for n in alternatives
+                ],
                 metadata={
                     "path_probability": best_path.total_probability,
                     "path_length": best_path.length,
-                    "simulations": num_simulations
+                    "simulations": num_simulations,
+                    "total_visits": stats["total_visits"],
+                    "max_depth_reached": stats["max_depth"]
                 }
             )
 
@@ -107,32 +129,37 @@ class ConversationEngine:
             logger.error(f"Error getting next response: {e}")
             raise
 
-    def _get_alternative_responses(
+    def _reuse_root(
         self,
-        node: ConversationNode,
-        max_alternatives: int = 3
-    ) -> List[Dict[str, float]]:
+        conversation_history: List[str],
+        contexts: Tuple[UserContext, Dict[str, Any]]
+    ) -> Optional[ConversationNode]:
         """
-        Get alternative responses with their scores.
+        Find the node of the previous tree matching the last two turns.
+
+        Returns the grandchild of the previous root whose messages match
+        ``conversation_history[-2:]``, detached as a new root, or None if
+        the tree can't be reused.
         """
-        if not node.parent or not node.parent.children:
-            return []
-
-        siblings = [
-            n for n in node.parent.children
-            if n != node and n.score is not None
-        ]
-
-        # Sort by score and probability
-        siblings.sort(
-            key=lambda n: (n.score or 0) * n.probability,
-            reverse=True
-        )
+        last_root = self._last_root
+        self._last_root = None
+        if (
+            last_root is None
+            or len(conversation_history) < 2
+            or contexts != self._last_contexts
+        ):
+            return None
 
-        return [
-            {"message": n.message, "score": n.score or 0}
-            for n in siblings[:max_alternatives]
-        ]
+        response, reply = conversation_history[-2:]
+        for child in last_root.children:
+            if child.message != response:
+                continue
+            for grandchild in child.children:
+                # A leaf has no statistics worth keeping
+                if grandchild.message == reply and grandchild.children:
+                    grandchild.detach()
+                    return grandchild
+        return None
 
     async def evaluate_conversation(
         self,
@@ -153,30 +180,11 @@ class ConversationEngine:
     ) -> Dict[str, Any]:
         """
         Analyze possible future paths for the conversation.
-        """
-        # Create temporary config with smaller depth
-        temp_config = SimulationConfig(
-            max_depth=depth,
-            branching_factor=self.config.branching_factor,
-            prune_threshold=self.config.prune_threshold,
-            batch_size=self.config.batch_size
-        )
-
-        # Create temporary MCTS instance
-        temp_mcts = MCTS(
-            api_client=self.api_client,
-            config=temp_config,
-            exploration_constant=self.mcts.exploration_constant
-        )
-
-        # Create root node
-        root = ConversationNode(
-            message=conversation_history[-1] if conversation_history else "",
-            probability=1.0,
-            turn_type="opponent" if conversation_history else "user",
-            metadata={"visits": 1}
-        )
 
+        When the tree searched by the last get_next_response call reaches
+        the end of this conversation, the analysis is read from it, cut
+        off at ``depth``. Otherwise a fresh search to ``depth`` is run.
+        """
         # Create user context
         user_ctx = UserContext(
             style=user_context.get("style", "professional"),
@@ -184,22 +192,50 @@ class ConversationEngine:
             goals=[goal],
             constraints=user_context.get("constraints", {})
         )
+        opp_context = {
+            "style": "professional",
+            "personality": "neutral",
+            "goals": ["engage in meaningful conversation"]
+        }
 
-        # Perform limited search
-        best_node = await temp_mcts.search(
-            root=root,
-            user_context=user_ctx,
-            opponent_context={
-                "style": "professional",
-                "personality": "neutral",
-                "goals": ["engage in meaningful conversation"]
-            },
-            num_simulations=50
-        )
+        mcts = self.mcts
+        root = self._analysis_root(conversation_history, (user_ctx, opp_context))
+        if root is None:
+            # Create temporary config with smaller depth
+            temp_config = SimulationConfig(
+                max_depth=depth,
+                branching_factor=self.config.branching_factor,
+                prune_threshold=self.config.prune_threshold,
+                batch_size=self.config.batch_size,
+                max_concurrent=self.config.max_concurrent
+            )
+
+            # Create temporary MCTS instance
+            mcts = MCTS(
+                api_client=self.api_client,
+                config=temp_config,
+                exploration_constant=self.mcts.exploration_constant
+            )
+
+            # Create root node
+            root = ConversationNode(
+                message=conversation_history[-1] if conversation_history else "",
+                probability=1.0,
+                turn_type="opponent" if conversation_history else "user",
+                visits=1
+            )
+
+            # Perform limited search, exploring the top branches concurrently
+            await mcts.search_subtrees(
+                root=root,
+                user_context=user_ctx,
+                opponent_context=opp_context,
+                num_simulations=50
+            )
+
+        # Get best path, top alternatives and tree statistics
+        best_path, alternatives, stats = mcts.summarize(root, max_depth=depth)
 
-        # Get best path and top alternatives
-        best_path = temp_mcts.get_best_path(best_node)
-        
         return {
             "best_path": {
                 "messages": best_path.messages,
@@ -208,29 +244,49 @@ class ConversationEngine:
             },
             "alternative_paths": [
                 {
-                    "messages": temp_mcts.get_best_path(child).messages,
+                    "messages": mcts.get_best_path(child, depth).messages,
                     "probability": child.probability,
                     "score": child.score or 0.0
                 }
-                for child in root.children[:3]
-                if child != best_node
+                for child in alternatives
             ],
             "analysis": {
-                "total_nodes_explored": sum(
-                    node.metadata.get("visits", 0)
-                    for node in self._get_all_nodes(root)
-                ),
-                "max_depth_reached": max(
-                    node.depth
-                    for node in self._get_all_nodes(root)
-                ),
-                "branching_factor": len(root.children)
+                "total_nodes_explored": stats["total_visits"],
+                "max_depth_reached": stats["max_depth"],
+                "branching_factor": stats["branching_factor"]
             }
         }
 
-    def _get_all_nodes(self, root: ConversationNode) -> List[ConversationNode]:
-        """Get all nodes in the tree."""
-        nodes = [root]
-        for child in root.children:
-            nodes.extend(self._get_all_nodes(child))
-        return nodes 
\ No newline at end of file
+    def _analysis_root(
+        self,
+        conversation_history: List[str],
+        contexts: Tuple[UserContext, Dict[str, Any]]
+    ) -> Optional[ConversationNode]:
+        """
+        Find the node of the last searched tree at the end of a conversation.
+
+        That is the last root itself, or its child matching the final turn
+        once the chosen response has been appended. Returns None if there
+        is no such node with search results below it.
+        """
+        root = self._last_root
+        if (
+            root is None
+            or not conversation_history
+            or contexts != self._last_contexts
+        ):
+            return None
+
+        if conversation_history[-1] == root.message:
+            node = root
+        elif len(conversation_history) >= 2 and conversation_history[-2] == root.message:
+            node = next(
+                (c for c in root.children if c.message == conversation_history[-1]),
+                None
+            )
+        else:
+            return None
+
+        if node is None or not any(c.score is not None for c in node.children):
+            return None
+        return node
@@ -3,8 +3,10 @@ Monte Carlo Tree Search implementation for conversation path optimization.
 """
 
 import asyncio
-import math
-from typing import List, Dict, Any, Optional, Tuple
+import heapq
+import random
+from collections import OrderedDict
+from typing import Awaitable, List, Dict, Any, Optional, Tuple, TypeVar
 import numpy as np
 from loguru import logger
 
@@ -16,6 +18,8 @@ from social_stockfish.models import (
 )
 from social_stockfish.api import OpenRouterClient
 
+T = TypeVar("T")
+
 
 class MCTS:
     """
@@ -32,11 +36,21 @@ class MCTS:
         self.api_client = api_client
         self.config = config
         self.exploration_constant = exploration_constant
-        self._cache: Dict[str, Any] = {}
+        # LRU of evaluation scores keyed by goal and conversation history
+        self._cache: OrderedDict[Tuple[str, bytes], float] = OrderedDict()
+        # Bounds the API calls in flight across a whole simulation batch
+        self._sem = asyncio.Semaphore(config.max_concurrent)
+        # log(1..N) for UCB1 parent visit counts, grown on demand
+        self._log_table = np.log(np.arange(1, 1025, dtype=np.float64))
+
+    async def _guarded(self, coro: Awaitable[T]) -> T:
+        """Await an API call once a concurrency slot is free."""
+        async with self._sem:
+            return await coro
 
-    def _get_cache_key(self, node: ConversationNode) -> str:
+    def _get_cache_key(self, node: ConversationNode) -> bytes:
         """Generate a cache key for a conversation state."""
-        return "|".join(node.get_conversation_history())
+        return node.get_history_digest()
 
     async def search(
         self,
@@ -47,163 +61,299 @@ class MCTS:
     ) -> ConversationNode:
         """
         Perform Monte Carlo Tree Search to find the best next move.
+
+        Simulations run in batches of ``config.batch_size``: selections are
+        made back-to-back with virtual loss applied along each selected
+        path, the leaves are expanded and evaluated concurrently, and the
+        results are backpropagated once the batch completes. With
+        ``config.simulation_timeout`` set, expansion and evaluation of a
+        batch share that deadline; work still running is discarded.
         """
-        for _ in range(num_simulations):
-            # Selection
-            node = self._select(root)
+        goal = user_context.goals[0]  # Using first goal for now
+        # Serialized once and shared by every expansion of this search
+        user_ctx_dict = user_context.model_dump()
+        remaining = num_simulations
+        loop = asyncio.get_running_loop()
+        timeout = self.config.simulation_timeout
+        failed_batches = 0
+
+        while remaining > 0:
+            batch_size = min(self.config.batch_size, remaining)
+
+            # Selection. A leaf that is already pending means the tree has
+            # nothing else to offer until this batch is expanded (e.g. a
+            # fresh root), so the batch stops there rather than scoring the
+            # same node repeatedly.
+            leaves = []
+            for _ in range(batch_size):
+                node = self._select(root)
+                if node.virtual_loss and not node.children:
+                    break
+                self._apply_virtual_loss(node, 1)
+                leaves.append(node)
+            remaining -= len(leaves)
+            deadline = None if timeout is None else loop.time() + timeout
 
             # Expansion
-            if not node.children and node.depth < self.config.max_depth:
-                await self._expand(node, user_context, opponent_context)
-
-            # Simulation
-            if node.children:
-                score = await self._simulate(
-                    node,
-                    user_context,
-                    opponent_context
-                )
-            else:
-                score = await self._evaluate_terminal(
-                    node,
-                    user_context.goals[0]  # Using first goal for now
-                )
+            expandable = list({
+                id(node): node for node in leaves
+                if not node.children and node.depth < self.config.max_depth
+            }.values())
+            await self._expand_many(
+                expandable, user_ctx_dict, opponent_context, timeout
+            )
 
-            # Backpropagation
-            self._backpropagate(node, score)
+            # Simulation, in whatever time the expansions left
+            tasks = [
+                asyncio.ensure_future(self._simulate(node, goal))
+                for node in leaves
+            ]
+            done, pending = await asyncio.wait(
+                tasks,
+                timeout=None if deadline is None else max(0.0, deadline - loop.time())
+            )
+            for task in pending:
+                task.cancel()
+
+            # Backpropagation; stragglers and failures are discarded
+            for node in leaves:
+                self._revert_virtual_loss(node, 1)
+            scores = [
+                (node, task.result())
+                for node, task in zip(leaves, tasks)
+                if task in done
+            ]
+            if scores and all(score is None for _, score in scores):
+                # A lone failure is tolerated, but if nothing has got through
+                # for several batches don't burn the rest of the budget
+                failed_batches += 1
+                if failed_batches >= self.config.max_failed_batches:
+                    raise RuntimeError(
+                        f"Every simulation failed in {failed_batches} consecutive batches"
+                    )
+            elif scores:
+                failed_batches = 0
+            for node, score in scores:
+                if score is not None:
+                    self._backpropagate(node, score)
 
         # Return best child of root
         return self._get_best_child(root, exploration=False)
 
+    async def search_subtrees(
+        self,
+        root: ConversationNode,
+        user_context: UserContext,
+        opponent_context: Dict[str, Any],
+        num_simulations: int = 100,
+        max_subtrees: int = 3
+    ) -> None:
+        """
+        Expand the root, then search its first children concurrently.
+
+        The simulation budget is split evenly between the ``max_subtrees``
+        subtree searches, whose API calls share the concurrency limit.
+        Results are backpropagated through the root as usual.
+        """
+        if not root.children:
+            await self._expand(root, user_context.model_dump(), opponent_context)
+
+        subtrees = root.children[:max_subtrees]
+        if not subtrees:
+            return
+        await asyncio.gather(*[
+            self.search(
+                root=child,
+                user_context=user_context,
+                opponent_context=opponent_context,
+                num_simulations=num_simulations // len(subtrees)
+            )
+            for child in subtrees
+        ])
+
     def _select(self, node: ConversationNode) -> ConversationNode:
         """
         Select a node for expansion using UCB1.
         """
         current = node
         while current.children:
-            if not all(child.score is not None for child in current.children):
-                # If any child is unvisited, select it
-                unvisited = [c for c in current.children if c.score is None]
-                return np.random.choice(unvisited)
+            # If any child is unvisited and not pending in this batch, select it
+            tree = current._tree
+            ids = current._child_ids
+            unvisited = np.flatnonzero(
+                np.isnan(tree.scores[ids]) & (tree.virtual_loss[ids] == 0)
+            )
+            if unvisited.size:
+                return current.children[unvisited[random.randrange(unvisited.size)]]
             current = self._get_best_child(current, exploration=True)
         return current
 
+    def _apply_virtual_loss(self, node: ConversationNode, n_c: int) -> None:
+        """
+        Count pending visits along a selected path as losses.
+
+        Steers the remaining selections of a batch away from this path
+        until the real results are backpropagated.
+        """
+        tree, path = node.stats_path()
+        tree.visits[path] += n_c
+        tree.virtual_loss[path] += n_c
+
+    def _revert_virtual_loss(self, node: ConversationNode, n_c: int) -> None:
+        """Remove virtual loss previously applied along a path."""
+        tree, path = node.stats_path()
+        tree.visits[path] -= n_c
+        tree.virtual_loss[path] -= n_c
+
     async def _expand(
         self,
         node: ConversationNode,
-        user_context: UserContext,
+        user_context: Dict[str, Any],
         opponent_context: Dict[str, Any]
     ) -> None:
         """
         Expand a node by generating possible responses.
+
+        ``user_context`` is the serialized UserContext of the search.
         """
         history = node.get_conversation_history()
         is_user_turn = node.depth % 2 == 0
+        goal = user_context["goals"][0]  # Using first goal for now
+        context = user_context if is_user_turn else opponent_context
 
-        # Generate responses in parallel
-        tasks = []
-        for _ in range(self.config.branching_factor):
-            if is_user_turn:
-                task = self.api_client.generate_user_response(
-                    history,
-                    user_context.dict(),
-                    temperature=self.config.temperature,
-                    top_p=self.config.top_p
-                )
-            else:
-                task = self.api_client.generate_opponent_response(
-                    history,
-                    opponent_context,
-                    temperature=self.config.temperature,
-                    top_p=self.config.top_p
-                )
-            tasks.append(task)
-
-        responses = await asyncio.gather(*tasks, return_exceptions=True)
-
-        valid_responses = []
-        for response in responses:
-            if isinstance(response, Exception):
-                logger.error(f"Error generating response: {response}")
-                continue
-            try:
-                message = response["choices"][0]["message"]["content"]
-                probability = float(response["choices"][0]["message"].get("probability", 0.5))
-                valid_responses.append((message, probability))
-            except (KeyError, IndexError, ValueError) as e:
-                logger.error(f"Error parsing response: {e}")
-                continue
+        # One call yields every branch plus a score for this node's state
+        try:
+            result = await self._guarded(self.api_client.generate_and_score(
+                history,
+                context,
+                k=self.config.branching_factor,
+                is_user=is_user_turn,
+                goal=goal,
+                temperature=self.config.temperature,
+                top_p=self.config.top_p
+            ))
+        except Exception as e:
+            logger.error(f"Error generating response: {e}")
+            return
+
+        if result["self_score"] is not None:
+            self._store_score((goal, self._get_cache_key(node)), result["self_score"])
 
         # Create child nodes
-        for message, probability in valid_responses:
+        for candidate in result["candidates"]:
             child = ConversationNode(
-                message=message,
-                probability=probability,
-                turn_type="user" if is_user_turn else "opponent",
-                metadata={"visits": 0}
+                message=candidate["message"],
+                probability=candidate["probability"],
+                turn_type="user" if is_user_turn else "opponent"
             )
             node.add_child(child)
 
-    async def _simulate(
+    async def _expand_many(
         self,
-        node: ConversationNode,
-        user_context: UserContext,
-        opponent_context: Dict[str, Any]
-    ) -> float:
+        nodes: List[ConversationNode],
+        user_context: Dict[str, Any],
+        opponent_context: Dict[str, Any],
+        timeout: Optional[float] = None
+    ) -> None:
         """
-        Simulate a random path from node to terminal state.
+        Expand several nodes concurrently.
+
+        Requests are throttled by ``config.max_concurrent``. Expansions still
+        running after ``timeout`` seconds are cancelled, leaving those nodes
+        unexpanded.
         """
-        current = node
-        path = []
+        if not nodes:
+            return
 
-        while current.depth < self.config.max_depth:
-            if not current.children:
-                await self._expand(current, user_context, opponent_context)
-                if not current.children:
-                    break
-            current = np.random.choice(current.children)
-            path.append(current)
+        tasks = [
+            asyncio.ensure_future(self._expand(node, user_context, opponent_context))
+            for node in nodes
+        ]
+        _, pending = await asyncio.wait(tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
 
-        return await self._evaluate_terminal(
-            current,
-            user_context.goals[0]  # Using first goal for now
-        )
+    async def _simulate(
+        self,
+        node: ConversationNode,
+        goal: str
+    ) -> Optional[float]:
+        """
+        Score a selected node.
+
+        There is no random playout: selection already expands one step,
+        and the node's own evaluation serves as the bootstrap value.
+        Returns None if the evaluation fails; the API client has already
+        retried transient errors by then.
+        """
+        try:
+            return await self._evaluate_terminal(node, goal)
+        except Exception as e:
+            logger.error(f"Error simulating node: {e}")
+            return None
 
     async def _evaluate_terminal(
         self,
         node: ConversationNode,
-        goal: str
+        goal: str,
+        force: bool = False
     ) -> float:
         """
         Evaluate a terminal state.
+
+        Nodes more than one turn above ``max_depth`` whose parent has
+        already been scored inherit that score, weighted by their own
+        probability, instead of calling the evaluator. Set ``force`` to
+        always evaluate uncached states.
         """
-        cache_key = self._get_cache_key(node)
-        if cache_key in self._cache:
-            return self._cache[cache_key]
+        cache_key = (goal, self._get_cache_key(node))
+        score = self._cache.get(cache_key)
+        if score is not None:
+            self._cache.move_to_end(cache_key)
+            return score
+
+        parent = node.parent
+        if (
+            not force
+            and parent is not None
+            and parent.score is not None
+            and self.config.max_depth - node.depth > 1
+        ):
+            return parent.score * node.probability
 
         conversation = node.get_conversation_history()
-        score = await self.api_client.evaluate_conversation(conversation, goal)
+        score = await self._guarded(
+            self.api_client.evaluate_conversation(conversation, goal)
+        )
 
         # Cache the result
-        self._cache[cache_key] = score
-        if len(self._cache) > self.config.cache_size:
-            # Remove a random key if cache is full
-            del self._cache[np.random.choice(list(self._cache.keys()))]
+        self._store_score(cache_key, score)
 
         return score
 
+    def _store_score(self, cache_key: Tuple[str, bytes], score: float) -> None:
+        """Cache an evaluation score."""
+        self._cache[cache_key] = score
+        self._cache.move_to_end(cache_key)
+        if len(self._cache) > self.config.cache_size:
+            # Evict the least recently used score if cache is full
+            self._cache.popitem(last=False)
+
     def _backpropagate(self, node: ConversationNode, score: float) -> None:
         """
         Backpropagate the evaluation score up the tree.
+
+        Updates the running mean score of every node on the path at once.
         """
-        current = node
-        while current is not None:
-            current.metadata["visits"] = current.metadata.get("visits", 0) + 1
-            if current.score is None:
-                current.score = score
-            else:
-                current.score = (current.score * (current.metadata["visits"] - 1) + score) / current.metadata["visits"]
-            current = current.parent
+        tree, path = node.stats_path()
+        visits = tree.visits[path] + 1
+        scores = tree.scores[path]
+        tree.visits[path] = visits
+        tree.scores[path] = np.where(
+            np.isnan(scores),
+            score,
+            scores + (score - scores) / visits
+        )
 
     def _get_best_child(
         self,
@@ -213,37 +363,58 @@ class MCTS:
         """
         Select the best child node using UCB1 formula.
         """
+        if not node.children:
+            return None
+
+        tree = node._tree
+        ids = node._child_ids
+        scores = tree.scores[ids]
+        visits = tree.visits[ids]
         if exploration:
-            # UCB1 formula
-            log_parent_visits = math.log(node.metadata["visits"])
-            ucb_scores = []
-            for child in node.children:
-                if child.score is None:
-                    ucb_scores.append(float("inf"))
-                else:
-                    exploitation = child.score
-                    exploration_term = self.exploration_constant * math.sqrt(
-                        log_parent_visits / child.metadata["visits"]
-                    )
-                    ucb_scores.append(exploitation + exploration_term)
-            return node.children[np.argmax(ucb_scores)]
+            # UCB1 formula, counting pending virtual visits as zero-score
+            # results; unvisited children (NaN) are always tried first
+            virtual_loss = tree.virtual_loss[ids]
+            log_parent_visits = self._log_visits(tree.visits[node._id])
+            with np.errstate(divide="ignore", invalid="ignore"):
+                exploitation = np.where(
+                    np.isnan(scores) & (virtual_loss > 0),
+                    0.0,
+                    scores * (visits - virtual_loss) / visits
+                )
+                ucb_scores = exploitation + self.exploration_constant * np.sqrt(
+                    log_parent_visits / visits
+                )
+            ucb_scores[np.isnan(ucb_scores)] = np.inf
+            return node.children[int(np.argmax(ucb_scores))]
         else:
             # For final selection, use score and visit count
-            scores = [
-                (child.score or 0) * child.probability * math.sqrt(child.metadata["visits"])
-                for child in node.children
-            ]
-            return node.children[np.argmax(scores)]
+            final_scores = np.nan_to_num(scores) * tree.probs[ids] * np.sqrt(visits)
+            return node.children[int(np.argmax(final_scores))]
 
-    def get_best_path(self, node: ConversationNode) -> ConversationPath:
+    def _log_visits(self, visits: int) -> float:
+        """Look up log(visits) in the log table, growing it as needed."""
+        if visits < 1:
+            raise ValueError(f"log of a visit count needs visits >= 1, got {visits}")
+        if visits > len(self._log_table):
+            size = max(2 * len(self._log_table), visits)
+            self._log_table = np.log(np.arange(1, size + 1, dtype=np.float64))
+        return self._log_table[visits - 1]
+
+    def get_best_path(
+        self,
+        node: ConversationNode,
+        max_length: Optional[int] = None
+    ) -> ConversationPath:
         """
         Get the best conversation path from a node.
+
+        The path stops after ``max_length`` nodes if given.
         """
         path = [node]
         current = node
         total_prob = node.probability
 
-        while current.children:
+        while current.children and (max_length is None or len(path) < max_length):
             current = self._get_best_child(current, exploration=False)
             path.append(current)
             total_prob *= current.probability
@@ -252,4 +423,51 @@ class MCTS:
             nodes=path,
             total_probability=total_prob,
             final_score=path[-1].score or 0.0
-        ) 
\ No newline at end of file
+        )
+
+    def summarize(
+        self,
+        root: ConversationNode,
+        max_alternatives: int = 3,
+        max_depth: Optional[int] = None
+    ) -> Tuple[ConversationPath, List[ConversationNode], Dict[str, int]]:
+        """
+        Summarize a searched tree.
+
+        Returns the best path from the root's best child, up to
+        ``max_alternatives`` of that child's scored siblings ranked by
+        score and probability, and tree statistics, collected in a single
+        walk over the tree. Depths are relative to ``root``; with
+        ``max_depth`` set, deeper nodes are left out of both the path and
+        the statistics.
+        """
+        best_node = self._get_best_child(root, exploration=False)
+        if best_node is None:
+            raise ValueError("Search produced no candidate responses")
+
+        alternatives = heapq.nlargest(
+            max_alternatives,
+            (
+                child for child in root.children
+                if child is not best_node and child.score is not None
+            ),
+            key=lambda n: n.score * n.probability
+        )
+
+        total_visits = 0
+        depth_reached = 0
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            depth = node.depth - root.depth
+            total_visits += node.visits
+            depth_reached = max(depth_reached, depth)
+            if max_depth is None or depth < max_depth:
+                stack.extend(node.children)
+
+        stats = {
+            "total_visits": total_visits,
+            "max_depth": depth_reached,
+            "branching_factor": len(root.children)
+        }
+        return self.get_best_path(best_node, max_depth), alternatives, stats
@@ -2,29 +2,223 @@
 Core data structures for the Social Stockfish system.
 """
 
-from typing import Dict, List, Optional, Any
+import hashlib
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Any, Tuple
+import numpy as np
 from pydantic import BaseModel, Field
 
 
-class ConversationNode(BaseModel):
+# Shared empty index array for nodes without children
+_NO_IDS = np.empty(0, dtype=np.intp)
+
+
+class TreeStats:
+    """
+    Search statistics of a conversation tree, stored as flat arrays.
+
+    Every node attached to the tree owns one index into the arrays, so
+    selection, virtual loss and backpropagation work on whole slices.
+    Unscored nodes hold NaN.
+    """
+    __slots__ = ("size", "scores", "visits", "virtual_loss", "probs")
+
+    def __init__(self, capacity: int = 64):
+        """Initialize empty statistics arrays."""
+        self.size = 0
+        self.scores = np.empty(capacity, dtype=np.float64)
+        self.visits = np.empty(capacity, dtype=np.int64)
+        self.virtual_loss = np.empty(capacity, dtype=np.int64)
+        self.probs = np.empty(capacity, dtype=np.float64)
+
+    def add(
+        self,
+        score: Optional[float],
+        visits: int,
+        virtual_loss: int,
+        probability: float
+    ) -> int:
+        """Allocate an index for a node, growing the arrays as needed."""
+        if self.size == len(self.visits):
+            for name in ("scores", "visits", "virtual_loss", "probs"):
+                array = getattr(self, name)
+                setattr(self, name, np.concatenate((array, np.empty_like(array))))
+
+        index = self.size
+        self.scores[index] = np.nan if score is None else score
+        self.visits[index] = visits
+        self.virtual_loss[index] = virtual_loss
+        self.probs[index] = probability
+        self.size += 1
+        return index
+
+
+class ConversationNode:
     """
     Represents a single node in the conversation tree.
     Each node contains a message, its probability, and links to child nodes.
+
+    Nodes are created in bulk during search, so this is a plain slotted
+    class rather than a validated model. Once a node has a parent or
+    children, its score, visits and virtual loss live in the tree's
+    TreeStats arrays.
     """
-    message: str = Field(..., description="The text content of this conversation turn")
-    probability: float = Field(..., ge=0.0, le=1.0, description="Probability of this response")
-    score: Optional[float] = Field(None, description="Evaluation score for this path")
-    children: List["ConversationNode"] = Field(default_factory=list, description="Child nodes")
-    metadata: Dict[str, Any] = Field(default_factory=dict, description="Additional metadata")
-    parent: Optional["ConversationNode"] = Field(None, description="Parent node reference")
-    depth: int = Field(0, description="Depth in the conversation tree")
-    turn_type: str = Field(..., description="Type of turn: 'user' or 'opponent'")
+    __slots__ = (
+        "message",
+        "probability",
+        "children",
+        "metadata",
+        "parent",
+        "depth",
+        "turn_type",
+        "_tree",
+        "_id",
+        "_path",
+        "_child_ids",
+        "_score",
+        "_visits",
+        "_virtual_loss",
+        "_cached_history",
+        "_history_digest"
+    )
+
+    def __init__(
+        self,
+        *,
+        message: str,
+        probability: float,
+        turn_type: str,
+        score: Optional[float] = None,
+        visits: int = 0,
+        children: Optional[List["ConversationNode"]] = None,
+        metadata: Optional[Dict[str, Any]] = None,
+        parent: Optional["ConversationNode"] = None,
+        depth: int = 0
+    ):
+        """Initialize a conversation node."""
+        if not 0.0 <= probability <= 1.0:
+            raise ValueError(f"probability must be between 0 and 1, got {probability}")
+
+        self.message = message  # The text content of this conversation turn
+        self.probability = probability  # Probability of this response
+        self.children: List["ConversationNode"] = []
+        self.metadata = metadata if metadata is not None else {}
+        self.parent = parent
+        self.depth = depth  # Depth in the conversation tree
+        self.turn_type = turn_type  # Type of turn: 'user' or 'opponent'
+
+        # Statistics are held on the node until it joins a tree
+        self._tree: Optional[TreeStats] = None
+        self._id = 0
+        self._path = _NO_IDS  # Indices of the nodes from the root to this one
+        self._child_ids = _NO_IDS  # Indices of the children, in order
+        self._score = score  # Evaluation score for this path
+        self._visits = visits  # Number of search visits
+        self._virtual_loss = 0
+
+        # Memoized root-to-node history and its digest; both are fixed once
+        # the node is attached to its parent
+        self._cached_history: Optional[List[str]] = None
+        self._history_digest: Optional[bytes] = None
+
+        for child in children or ():
+            self.add_child(child)
+
+    def __repr__(self) -> str:
+        return (
+            f"ConversationNode(message={self.message!r}, "
+            f"probability={self.probability}, score={self.score}, "
+            f"depth={self.depth}, turn_type={self.turn_type!r}, "
+            f"children={len(self.children)})"
+        )
+
+    @property
+    def score(self) -> Optional[float]:
+        """Evaluation score for this path, or None if unscored."""
+        if self._tree is None:
+            return self._score
+        score = self._tree.scores[self._id]
+        return None if np.isnan(score) else float(score)
+
+    @score.setter
+    def score(self, value: Optional[float]) -> None:
+        if self._tree is None:
+            self._score = value
+        else:
+            self._tree.scores[self._id] = np.nan if value is None else value
+
+    @property
+    def visits(self) -> int:
+        """Number of search visits, including pending virtual visits."""
+        if self._tree is None:
+            return self._visits
+        return int(self._tree.visits[self._id])
+
+    @visits.setter
+    def visits(self, value: int) -> None:
+        if self._tree is None:
+            self._visits = value
+        else:
+            self._tree.visits[self._id] = value
+
+    @property
+    def virtual_loss(self) -> int:
+        """Number of pending virtual visits counted as losses."""
+        if self._tree is None:
+            return self._virtual_loss
+        return int(self._tree.virtual_loss[self._id])
 
     def add_child(self, child: "ConversationNode") -> None:
         """Add a child node to this node."""
+        tree, path = self.stats_path()
         child.parent = self
-        child.depth = self.depth + 1
+        child._join(tree, path, self.depth + 1)
         self.children.append(child)
+        self._child_ids = np.append(self._child_ids, child._id)
+
+    def stats_path(self) -> Tuple[TreeStats, np.ndarray]:
+        """
+        Get the tree's statistics and this node's root-to-node indices.
+        """
+        if self._tree is None:
+            self._join(TreeStats(), _NO_IDS, self.depth)
+        return self._tree, self._path
+
+    def _join(self, tree: TreeStats, prefix: np.ndarray, depth: int) -> None:
+        """
+        Move this node's subtree into a tree's statistics.
+
+        Indices, paths and depths are reassigned below ``prefix`` and
+        ``depth``, and memoized histories and digests are dropped.
+        """
+        stack = [(self, prefix, depth)]
+        moved = []
+        while stack:
+            node, prefix, depth = stack.pop()
+            index = tree.add(node.score, node.visits, node.virtual_loss, node.probability)
+            node._tree = tree
+            node._id = index
+            node._path = np.append(prefix, index)
+            node.depth = depth
+            node._cached_history = None
+            node._history_digest = None
+            moved.append(node)
+            stack.extend((child, node._path, depth + 1) for child in node.children)
+
+        for node in moved:
+            if node.children:
+                node._child_ids = np.array([c._id for c in node.children], dtype=np.intp)
+
+    def detach(self) -> None:
+        """
+        Make this node the root of its own subtree.
+
+        The subtree's statistics are compacted into a fresh TreeStats,
+        depths are rebased so this node sits at depth 0, and the memoized
+        histories and digests of the subtree are dropped.
+        """
+        self.parent = None
+        self._join(TreeStats(), _NO_IDS, 0)
 
     def get_path_to_root(self) -> List["ConversationNode"]:
         """Get the path from this node to the root."""
@@ -36,20 +230,42 @@ class ConversationNode(BaseModel):
         return list(reversed(path))
 
     def get_conversation_history(self) -> List[str]:
-        """Get the conversation history from root to this node."""
-        return [node.message for node in self.get_path_to_root()]
+        """
+        Get the conversation history from root to this node.
 
-    class Config:
-        arbitrary_types_allowed = True
+        The list is cached on the node and shared; it must not be mutated.
+        """
+        if self._cached_history is None:
+            if self.parent is None:
+                self._cached_history = [self.message]
+            else:
+                self._cached_history = self.parent.get_conversation_history() + [self.message]
+        return self._cached_history
 
+    def get_history_digest(self) -> bytes:
+        """
+        Get a digest of the conversation history from root to this node.
 
-class ConversationPath(BaseModel):
+        Chained from the parent's digest, so each node hashes only its own
+        message regardless of how long the conversation is.
+        """
+        if self._history_digest is None:
+            prefix = b"" if self.parent is None else self.parent.get_history_digest()
+            self._history_digest = hashlib.blake2b(
+                prefix + self.message.encode(),
+                digest_size=16
+            ).digest()
+        return self._history_digest
+
+
+@dataclass(slots=True)
+class ConversationPath:
     """
     Represents a complete conversation path from root to leaf.
     """
-    nodes: List[ConversationNode] = Field(..., description="Nodes in this path")
-    total_probability: float = Field(..., ge=0.0, le=1.0, description="Combined probability")
-    final_score: float = Field(..., description="Final evaluation score")
+    nodes: List[ConversationNode]  # Nodes in this path
+    total_probability: float  # Combined probability
+    final_score: float  # Final evaluation score
 
     @property
     def messages(self) -> List[str]:
@@ -69,10 +285,21 @@ class SimulationConfig(BaseModel):
     max_depth: int = Field(5, ge=1, description="Maximum conversation depth")
     branching_factor: int = Field(3, ge=1, description="Number of responses to generate per turn")
     prune_threshold: float = Field(0.1, ge=0.0, le=1.0, description="Probability threshold for pruning")
-    batch_size: int = Field(10, ge=1, description="Batch size for API calls")
+    batch_size: int = Field(10, ge=1, description="Number of simulations evaluated concurrently")
+    max_concurrent: int = Field(32, ge=1, description="Maximum API requests in flight during a search")
     temperature: float = Field(0.7, ge=0.0, le=2.0, description="Temperature for response generation")
     top_p: float = Field(0.9, ge=0.0, le=1.0, description="Top-p sampling parameter")
     cache_size: int = Field(1000, ge=0, description="Size of response cache")
+    simulation_timeout: Optional[float] = Field(
+        None,
+        gt=0.0,
+        description="Seconds to wait for a simulation batch before discarding stragglers"
+    )
+    max_failed_batches: int = Field(
+        3,
+        ge=1,
+        description="Consecutive batches with every simulation failed before a search aborts"
+    )
 
 
 class ConversationResponse(BaseModel):
@@ -81,7 +308,7 @@ class ConversationResponse(BaseModel):
     """
     message: str = Field(..., description="Best next response")
     confidence: float = Field(..., ge=0.0, le=1.0, description="Confidence score")
-    alternatives: List[Dict[str, float]] = Field(
+    alternatives: List[Dict[str, Any]] = Field(
         ...,
         description="Alternative responses with their scores"
     )
@@ -2,6 +2,7 @@
 Tests for the Social Stockfish conversation engine.
 """
 
+import asyncio
 import pytest
 from unittest.mock import AsyncMock, MagicMock, patch
 import json
@@ -40,6 +41,10 @@ def mock_api_client(mock_api_response):
     client.generate_user_response.return_value = mock_api_response
     client.generate_opponent_response.return_value = mock_api_response
     client.evaluate_conversation.return_value = 0.75
+    client.generate_and_score.return_value = {
+        "candidates": [{"message": "Test response", "probability": 0.8}],
+        "self_score": 0.75
+    }
     return client
 
 
@@ -82,6 +87,7 @@ async def test_get_next_response(mock_api_client, config, user_context):
     """Test getting next response."""
     engine = ConversationEngine(config=config)
     engine.api_client = mock_api_client
+    engine.mcts.api_client = mock_api_client
     
     conversation = ["Hello", "Hi there"]
     goal = "test goal"
@@ -99,6 +105,34 @@ async def test_get_next_response(mock_api_client, config, user_context):
     assert isinstance(response.metadata, dict)
 
 
+@pytest.mark.asyncio
+async def test_get_next_response_alternatives(mock_api_client, config, user_context):
+    """Test alternatives are reported when several responses are scored."""
+    engine = ConversationEngine(config=config)
+    engine.api_client = mock_api_client
+    engine.mcts.api_client = mock_api_client
+    mock_api_client.generate_and_score.return_value = {
+        "candidates": [
+            {"message": f"Response {i}", "probability": 0.5}
+            for i in range(3)
+        ],
+        "self_score": 0.75
+    }
+
+    response = await engine.get_next_response(
+        conversation_history=["Hello"],
+        goal="test goal",
+        user_context=user_context,
+        num_simulations=20
+    )
+
+    assert len(response.alternatives) == 2
+    for alternative in response.alternatives:
+        assert isinstance(alternative["message"], str)
+        assert alternative["message"] != response.message
+        assert isinstance(alternative["score"], float)
+
+
 @pytest.mark.asyncio
 async def test_evaluate_conversation(mock_api_client, config):
     """Test conversation evaluation."""
@@ -134,14 +168,79 @@ async def test_analyze_conversation(mock_api_client, config, user_context):
     assert "analysis" in analysis
 
 
+@pytest.mark.asyncio
+async def test_tree_reuse(mock_api_client, config, user_context):
+    """Test the search tree is carried over to the next turn."""
+    engine = ConversationEngine(config=config)
+    engine.api_client = mock_api_client
+    engine.mcts.api_client = mock_api_client
+
+    conversation = ["Hello"]
+    response = await engine.get_next_response(
+        conversation_history=conversation,
+        goal="test goal",
+        user_context=user_context,
+        num_simulations=20
+    )
+    first_root = engine._last_root
+    reply = first_root.children[0].children[0]
+    inherited_visits = reply.visits
+
+    conversation += [response.message, reply.message]
+    await engine.get_next_response(
+        conversation_history=conversation,
+        goal="test goal",
+        user_context=user_context,
+        num_simulations=20
+    )
+
+    assert engine._last_root is reply
+    assert reply.parent is None
+    assert reply.depth == 0
+    assert reply.get_conversation_history() == [reply.message]
+    assert reply.visits >= inherited_visits
+
+
+@pytest.mark.asyncio
+async def test_analysis_reuses_search(mock_api_client, config, user_context):
+    """Test analysis is read from the last searched tree."""
+    engine = ConversationEngine(config=config)
+    engine.api_client = mock_api_client
+    engine.mcts.api_client = mock_api_client
+
+    conversation = ["Hello"]
+    response = await engine.get_next_response(
+        conversation_history=conversation,
+        goal="test goal",
+        user_context=user_context,
+        num_simulations=20
+    )
+    calls = mock_api_client.generate_and_score.await_count
+
+    analysis = await engine.analyze_conversation(
+        conversation_history=conversation + [response.message],
+        goal="test goal",
+        user_context=user_context,
+        depth=2
+    )
+
+    assert mock_api_client.generate_and_score.await_count == calls
+    assert len(analysis["best_path"]["messages"]) <= 2
+    assert analysis["analysis"]["max_depth_reached"] <= 2
+    assert analysis["analysis"]["total_nodes_explored"] > 0
+
+
 @pytest.mark.asyncio
 async def test_error_handling(mock_api_client, config, user_context):
     """Test error handling."""
     engine = ConversationEngine(config=config)
     engine.api_client = mock_api_client
+    engine.mcts.api_client = mock_api_client
     
     # Simulate API error
     mock_api_client.generate_responses.side_effect = Exception("API Error")
+    mock_api_client.generate_and_score.side_effect = Exception("API Error")
+    mock_api_client.evaluate_conversation.side_effect = Exception("API Error")
     
     with pytest.raises(Exception):
         await engine.get_next_response(
@@ -158,14 +257,14 @@ async def test_conversation_node_operations():
         message="Hello",
         probability=1.0,
         turn_type="user",
-        metadata={"visits": 1}
+        visits=1
     )
     
     child = ConversationNode(
         message="Hi there",
         probability=0.8,
         turn_type="opponent",
-        metadata={"visits": 1}
+        visits=1
     )
     
     root.add_child(child)
@@ -173,6 +272,7 @@ async def test_conversation_node_operations():
     assert len(root.children) == 1
     assert child.parent == root
     assert child.depth == 1
+    assert child.visits == 1
     
     path = child.get_path_to_root()
     assert len(path) == 2
@@ -184,6 +284,12 @@ async def test_conversation_node_operations():
     assert history[0] == "Hello"
     assert history[1] == "Hi there"
 
+    other = ConversationNode(message="Hello", probability=1.0, turn_type="user")
+    other_child = ConversationNode(message="Hi there", probability=0.5, turn_type="opponent")
+    other.add_child(other_child)
+    assert other_child.get_history_digest() == child.get_history_digest()
+    assert root.get_history_digest() != child.get_history_digest()
+
 
 @pytest.mark.asyncio
 async def test_mcts_search(mock_api_client, config, user_context):
@@ -194,7 +300,7 @@ async def test_mcts_search(mock_api_client, config, user_context):
         message="Hello",
         probability=1.0,
         turn_type="user",
-        metadata={"visits": 1}
+        visits=1
     )
     
     user_ctx = UserContext(**user_context)
@@ -215,15 +321,83 @@ async def test_mcts_search(mock_api_client, config, user_context):
     assert best_node.score is not None
     assert best_node.probability > 0
 
+    # Only the first simulation is spent on the unexpanded root itself
+    assert root.visits == 11
+    assert sum(child.visits for child in root.children) == 9
+
+
+@pytest.mark.asyncio
+async def test_mcts_search_timeout(mock_api_client, config, user_context):
+    """Test that expansions outliving the simulation timeout are discarded."""
+    config.simulation_timeout = 0.05
+    config.batch_size = 1
+    result = mock_api_client.generate_and_score.return_value
+
+    async def generate_and_score(history, *args, **kwargs):
+        if len(history) > 1:
+            await asyncio.sleep(10)
+        return result
+
+    mock_api_client.generate_and_score.side_effect = generate_and_score
+    mcts = MCTS(api_client=mock_api_client, config=config)
+    root = ConversationNode(message="Hello", probability=1.0, turn_type="user")
+
+    best_node = await asyncio.wait_for(
+        mcts.search(
+            root=root,
+            user_context=UserContext(**user_context),
+            opponent_context={"goals": ["engage in conversation"]},
+            num_simulations=3
+        ),
+        timeout=1
+    )
+
+    assert best_node in root.children
+    assert not best_node.children
+
+
+@pytest.mark.asyncio
+async def test_mcts_search_transient_failure(mock_api_client, config, user_context):
+    """Test that a single failed evaluation doesn't abort the search."""
+    config.batch_size = 1
+
+    async def generate_and_score(history, *args, **kwargs):
+        # Distinct branches so every evaluation reaches the API
+        return {
+            "candidates": [
+                {"message": f"{history[-1]} {i}", "probability": 0.5}
+                for i in range(2)
+            ],
+            "self_score": None
+        }
+
+    mock_api_client.generate_and_score.side_effect = generate_and_score
+    mock_api_client.evaluate_conversation.side_effect = [
+        0.75, 0.75, 0.75, Exception("API Error"), *[0.75] * 6
+    ]
+    mcts = MCTS(api_client=mock_api_client, config=config)
+    root = ConversationNode(message="Hello", probability=1.0, turn_type="user")
+
+    best_node = await mcts.search(
+        root=root,
+        user_context=UserContext(**user_context),
+        opponent_context={"goals": ["engage in conversation"]},
+        num_simulations=10
+    )
+
+    assert best_node in root.children
+    assert mock_api_client.evaluate_conversation.await_count > 4
+    assert root.visits == 9
+
 
 @pytest.mark.asyncio
 async def test_api_client_operations(mock_api_response):
     """Test API client operations."""
     client = OpenRouterClient()
     
-    with patch("aiohttp.ClientSession.request") as mock_request:
-        mock_request.return_value.__aenter__.return_value.json = AsyncMock(
-            return_value=mock_api_response
+    with patch("aiohttp.ClientSession.post") as mock_request:
+        mock_request.return_value.__aenter__.return_value.read = AsyncMock(
+            return_value=json.dumps(mock_api_response).encode()
         )
         mock_request.return_value.__aenter__.return_value.raise_for_status = MagicMock()
         
@@ -232,4 +406,149 @@ async def test_api_client_operations(mock_api_response):
             model="test-model"
         )
         
-        assert response == mock_api_response 
\ No newline at end of file
+        assert response == mock_api_response 
+
+@pytest.mark.asyncio
+async def test_api_client_response_cache(mock_api_response):
+    """Test that identical requests are served from the response cache."""
+    client = OpenRouterClient(cache_size=1)
+    messages = [{"role": "user", "content": "Hello"}]
+
+    async def slow_request(body):
+        await asyncio.sleep(0.01)
+        return mock_api_response
+
+    with patch.object(
+        client, "_make_request", AsyncMock(side_effect=slow_request)
+    ) as mock_request:
+        first = await client.generate_responses(messages=messages, model="test-model")
+        second = await client.generate_responses(messages=messages, model="test-model")
+        assert first == second == mock_api_response
+        assert mock_request.call_count == 1
+
+        # Concurrent duplicates share a single request
+        client._response_cache.clear()
+        await asyncio.gather(*[
+            client.generate_responses(messages=messages, model="other-model")
+            for _ in range(3)
+        ])
+        assert mock_request.call_count == 2
+
+        # Least recently used entries are evicted
+        await client.generate_responses(messages=messages, model="test-model")
+        assert mock_request.call_count == 3
+        assert len(client._response_cache) == 1
+
+        # Cancelling the first caller doesn't fail the others sharing its request
+        client._response_cache.clear()
+        leader = asyncio.ensure_future(
+            client.generate_responses(messages=messages, model="test-model")
+        )
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(
+            client.generate_responses(messages=messages, model="test-model")
+        )
+        await asyncio.sleep(0)
+        leader.cancel()
+        assert await follower == mock_api_response
+        assert leader.cancelled()
+        assert mock_request.call_count == 4
+
+
+@pytest.mark.asyncio
+async def test_api_client_score_parsing():
+    """Test parsing of noisy evaluator replies."""
+    client = OpenRouterClient()
+    replies = {
+        "0.85": 0.85,
+        "0.85.": 0.85,
+        "Score: 0.7": 0.7,
+        ".5": 0.5,
+        "1": 1.0,
+        "1.5": 1.0,
+        "8/10.": 0.8,
+        "Score: 7.5 / 10": 0.75,
+        "Score: 10": 1.0,
+        "10/10": 1.0,
+        "no score": 0.0,
+    }
+
+    for content, expected in replies.items():
+        with patch.object(
+            client,
+            "generate_responses",
+            AsyncMock(return_value={"choices": [{"message": {"content": content}}]})
+        ):
+            score = await client.evaluate_conversation(["Hello"], "test goal")
+            assert score == pytest.approx(expected)
+
+
+@pytest.mark.asyncio
+async def test_api_client_generate_and_score():
+    """Test candidates and self score are parsed from one reply."""
+    client = OpenRouterClient(api_key="test_key", cache_size=0)
+    content = (
+        'Sure:\n```json\n{"candidates": ['
+        '{"message": "Hi", "probability": 0.6}, '
+        '{"message": "Hey", "probability": 1.4}, '
+        '{"probability": 0.2}, '
+        '{"message": "Yo"}], '
+        '"self_score": 0.3}\n```'
+    )
+
+    with patch.object(client, "generate_responses", new_callable=AsyncMock) as generate:
+        generate.return_value = {"choices": [{"message": {"content": content}}]}
+        result = await client.generate_and_score(
+            ["Hello"], {}, k=3, is_user=True, goal="test goal"
+        )
+        assert generate.await_count == 1
+        assert result == {
+            "candidates": [
+                {"message": "Hi", "probability": 0.6},
+                {"message": "Hey", "probability": 1.0}
+            ],
+            "self_score": 0.3
+        }
+
+        generate.return_value = {"choices": [{"message": {"content": "no json"}}]}
+        result = await client.generate_and_score(
+            ["Hello"], {}, k=3, is_user=False, goal="test goal"
+        )
+        assert result == {"candidates": [], "self_score": None}
+
+    # Malformed replies aren't cached, so the request is retried next time
+    client = OpenRouterClient(api_key="test_key")
+    replies = [
+        {"choices": [{"message": {"content": "no json"}}]},
+        {"choices": [{"message": {"content": content}}]},
+        {"choices": [{"message": {"content": content}}]},
+    ]
+    with patch.object(
+        client, "_make_request", AsyncMock(side_effect=replies)
+    ) as mock_request:
+        for expected in (0, 2, 2):
+            result = await client.generate_and_score(
+                ["Hello"], {}, k=3, is_user=True, goal="test goal"
+            )
+            assert len(result["candidates"]) == expected
+        assert mock_request.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_api_client_score_cache():
+    """Test that evaluation scores are cached on the conversation tail."""
+    client = OpenRouterClient(evaluation_window=2)
+    reply = {"choices": [{"message": {"content": "0.6"}}]}
+
+    with patch.object(
+        client, "generate_responses", AsyncMock(return_value=reply)
+    ) as mock_generate:
+        await client.evaluate_conversation(["A", "B", "C"], "test goal")
+        score = await client.evaluate_conversation(["X", "B", "C"], "test goal")
+        assert score == pytest.approx(0.6)
+        assert mock_generate.call_count == 1
+
+        await client.evaluate_conversation(["A", "B", "C"], "other goal")
+        await client.evaluate_conversation(["C"], "test goal")
+        await client.evaluate_conversation(["C"], "test goal")
+        assert mock_generate.call_count == 4